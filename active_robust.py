@@ -6,10 +6,10 @@ import yaml
 import numpy as np
 from tqdm import tqdm
 import time
-from numpyencoder import NumpyEncoder
 
 from src.training_manager import TrainPipeline
 from src.model_manager import flatten_grads, dist_grads_to_model
+from src.aggregation_manager import Mean
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 torch.backends.cudnn.deterministic = True
@@ -27,92 +27,238 @@ class ActiveSamplingRobust(TrainPipeline):
         np.random.seed(self.seed)
         torch.manual_seed(self.seed)
 
+    def init_jacobian(self):
+        """ Allocate the (num_batches x d) Jacobian once on the model device """
+        w = next(self.model.parameters())
+        d = sum(p.numel() for p in self.model.parameters())
+        print("Num of Parameters {}".format(d))
+        self.metrics["num_param"] = d
+
+        self.g_i = torch.empty(d, dtype=w.dtype, device=w.device)
+        if self.C_J is None and isinstance(self.gar, Mean):
+            # mean of the rows only needs a running sum - skip storing the Jacobian
+            self.g_sum = torch.zeros(d, dtype=w.dtype, device=w.device)
+            return
+
+        if self.C_J is None and w.is_cuda:
+            # GAR consumes G on host - only G lives in pinned host memory ; rows are flattened into a
+            # ring of device staging buffers and streamed to host as they are computed
+            # kept in the Jacobian dtype ~ low precision also halves host memory and the D2H traffic
+            self.G_host = torch.empty((self.num_batches, d), dtype=self.jacobian_dtype, pin_memory=True)
+            self.g_stage = [torch.empty(d, dtype=self.jacobian_dtype, device=w.device) for _ in range(2)]
+            # marks the D2H copy out of each staging buffer ~ waited on before the buffer is rewritten
+            self.stage_events = [torch.cuda.Event() for _ in range(2)]
+            self.copy_stream = torch.cuda.Stream()
+            return
+
+        # low precision (ex - bfloat16) storage halves the memory traffic of G
+        self.G = torch.empty((self.num_batches, d), dtype=self.jacobian_dtype, device=w.device)
+
+    def compute_grad(self, images, labels, out: torch.Tensor):
+        """ forward + backward on a batch ; the flattened grad g_i is written into out """
+        outputs = self.model(images)
+        self.optimizer.zero_grad(set_to_none=False)
+        loss = self.criterion(outputs, labels)
+        loss.backward()
+        flatten_grads(learner=self.model, out=out)
+
+    def capture_grad_graphs(self, images, labels):
+        """
+        Capture compute_grad into one CUDA graph per destination of g_i (each Jacobian row, each staging
+        buffer of the host Jacobian, or g_sum / g_i for the running sum) so the flatten writes straight into it.
+        Each step then only copies the batch into static inputs and replays the matching graph.
+        """
+        self.static_images = images.to(device)
+        self.static_labels = labels.to(device)
+        if self.g_sum is not None:
+            outs = [self.g_sum, self.g_i]
+        elif self.G_host is not None:
+            outs = self.g_stage
+        else:
+            outs = [self.G[ix] for ix in range(self.num_batches)]
+
+        # warm up on a side stream before capture (as required by torch.cuda.graph)
+        side_stream = torch.cuda.Stream()
+        side_stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(side_stream):
+            for _ in range(3):
+                self.compute_grad(images=self.static_images, labels=self.static_labels, out=self.g_i)
+        torch.cuda.current_stream().wait_stream(side_stream)
+
+        # graphs share one memory pool - safe in any replay order since no intermediate outlives a replay
+        self.grad_graphs = []
+        pool = None
+        for out in outs:
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph, pool=pool):
+                self.compute_grad(images=self.static_images, labels=self.static_labels, out=out)
+            pool = graph.pool()
+            self.grad_graphs.append(graph)
+
+    @staticmethod
+    def timer_start(events: list):
+        """ Start timing a step : on CUDA record a start event (appended to events) else return the host clock """
+        if device.type == 'cuda':
+            events.append((torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)))
+            events[-1][0].record()
+            return None
+        return time.time()
+
+    @staticmethod
+    def timer_stop(events: list, t0) -> float:
+        """ Stop timer_start ; returns host seconds (0 on CUDA where events are read once per epoch) """
+        if device.type == 'cuda':
+            events[-1][1].record()
+            return 0
+        return time.time() - t0
+
     def run_batch_train(self):
         np.random.seed(self.seed)
         torch.manual_seed(self.seed)
 
+        self.model.to(device)
+        # static grad buffers ~ backward accumulates into them instead of allocating new grads every iteration
+        for w in self.model.parameters():
+            w.grad = torch.zeros_like(w)
+        self.init_jacobian()
+        # aggregate every num_batches grads ~ trailing batches that do not fill a window are skipped
+        num_windows = len(self.train_loader) // self.num_batches
+        # CUDA kernels are async - time GPU work with events instead of host clocks
+        cuda_timing = device.type == 'cuda'
+        use_grad_graph = self.cuda_graph and device.type == 'cuda'
         while self.epoch < self.num_epochs:
-            self.model.to(device)
             self.model.train()
             epoch_grad_cost = 0
             epoch_agg_cost = 0
             epoch_gm_iter = 0
             epoch_compression_cost = 0
+            grad_events = []  # (start, end) cuda events per batch
+            compression_events = []  # (start, end) cuda events per compression step
+            agg_events = []  # (start, end) cuda events of on-device aggregation (running sum)
+
+            # lr only changes on lrs.step() at the end of the epoch
+            lr = self.optimizer.param_groups[0]['lr']
 
             # ------- Training Phase --------- #
             print('epoch {}/{} || learning rate: {}'.format(self.epoch,
                                                             self.num_epochs,
-                                                            self.optimizer.param_groups[0]['lr']))
-            p_bar = tqdm(total=len(self.train_loader))
+                                                            lr))
+            p_bar = tqdm(total=num_windows * self.num_batches)
             p_bar.set_description("Training Progress: ")
 
-            for batch_ix, (images, labels) in enumerate(self.train_loader):
-                self.metrics["num_iter"] += 1
-                t_iter = time.time()
-
-                # Forward Pass
-                images = images.to(device)
-                labels = labels.to(device)
-                outputs = self.model(images)
-                self.optimizer.zero_grad()
-                loss = self.criterion(outputs, labels)
-
-                # compute grad
-                loss.backward()
-                self.metrics["num_grad_steps"] += 1
-                # Note: No Optimizer Step yet.
-                g_i = flatten_grads(learner=self.model)
-                # Construct the Jacobian
-                if self.G is None:
-                    d = len(g_i)
-                    print("Num of Parameters {}".format(d))
-                    self.metrics["num_param"] = d
-                    self.G = np.zeros((self.num_batches, d), dtype=g_i.dtype)
-
-                ix = batch_ix % self.num_batches
-                agg_ix = (batch_ix + 1) % self.num_batches
-                self.G[ix, :] = g_i
-                iteration_time = time.time() - t_iter
-                epoch_grad_cost += iteration_time
-
-                p_bar.update()
-
-                if agg_ix == 0 and batch_ix != 0:
-                    lr = self.optimizer.param_groups[0]['lr']
-                    if self.C_J is not None:
-                        t0 = time.time()
-                        self.I_k = self.C_J.compress(G=self.G, lr=lr)
-                        epoch_compression_cost += time.time() - t0
-                        self.metrics["jacobian_residual"].append(self.C_J.normalized_residual)
-                        # Gradient aggregation - get aggregated gradient vector
-                        agg_g = self.gar.aggregate(G=self.C_J.G_sparse,
-                                                   ix=self.I_k,
-                                                   axis=self.C_J.axis)
+            loader_iter = iter(self.train_loader)
+            for _ in range(num_windows):
+                # ------- fill the Jacobian with num_batches grads --------- #
+                for ix in range(self.num_batches):
+                    images, labels = next(loader_iter)
+                    self.metrics["num_iter"] += 1
+                    if use_grad_graph and self.grad_graphs is None:
+                        self.capture_grad_graphs(images=images, labels=labels)
+
+                    # grad cost excludes batch fetch and graph capture (same on CPU and CUDA)
+                    t_iter = self.timer_start(grad_events)
+
+                    # Note: No Optimizer Step yet - g_i only goes into the Jacobian
+                    if self.g_sum is not None:
+                        # first batch of the window overwrites the running sum
+                        graph_ix = min(ix, 1)
+                        out = self.g_sum if ix == 0 else self.g_i
+                    elif self.G_host is not None:
+                        graph_ix = ix % 2
+                        out = self.g_stage[graph_ix]
+                        # staging buffer is free once its previous D2H copy is done
+                        torch.cuda.current_stream().wait_event(self.stage_events[graph_ix])
                     else:
-                        agg_g = self.gar.aggregate(G=self.G, ix=self.I_k, axis=0)
-
-                    epoch_gm_iter += self.gar.num_iter
-                    epoch_agg_cost += self.gar.agg_time
-                    # Reset GAR stats
-                    self.gar.agg_time = 0
-                    self.gar.num_iter = 0
-
-                    # Update Model Grads with aggregated g : i.e. compute \tilde(g)
-                    self.optimizer.zero_grad()
-                    dist_grads_to_model(grads=agg_g, learner=self.model)
-                    self.model.to(device)
-
-                    # Now Do an optimizer step with x_t+1 = x_t - \eta \tilde(g)
-                    self.optimizer.step()
-                    self.metrics["num_opt_steps"] += 1
-
-                self.metrics["epoch_grad_cost"].append(epoch_grad_cost)
-                self.metrics["epoch_agg_cost"].append(epoch_agg_cost)
-                if epoch_gm_iter > 0:
-                    self.metrics["epoch_gm_iter"].append(epoch_gm_iter)
-                if epoch_compression_cost > 0:
-                    # print("Epoch Sparse Approx Cost: {}".format(epoch_sparse_cost))
-                    self.metrics["epoch_compression_cost"].append(epoch_compression_cost)
+                        graph_ix = ix
+                        out = self.G[ix]
+
+                    if use_grad_graph and images.shape == self.static_images.shape:
+                        # static shapes ~ replay the captured forward + backward + flatten
+                        self.static_images.copy_(images, non_blocking=True)
+                        self.static_labels.copy_(labels, non_blocking=True)
+                        # graph captured with out as its flatten destination
+                        self.grad_graphs[graph_ix].replay()
+                    else:
+                        # eager path (also taken by a smaller last batch)
+                        images = images.to(device, non_blocking=True)
+                        labels = labels.to(device, non_blocking=True)
+                        self.compute_grad(images=images, labels=labels, out=out)
+                    self.metrics["num_grad_steps"] += 1
+
+                    if self.G_host is not None:
+                        # async D2H copy of the row overlaps with the next forward pass
+                        self.copy_stream.wait_stream(torch.cuda.current_stream())
+                        with torch.cuda.stream(self.copy_stream):
+                            self.G_host[ix].copy_(out, non_blocking=True)
+                            self.stage_events[graph_ix].record(self.copy_stream)
+                    epoch_grad_cost += self.timer_stop(grad_events, t_iter)
+
+                    if self.g_sum is not None and ix != 0:
+                        # accumulating the running sum is the mean GAR's aggregation work
+                        t0 = self.timer_start(agg_events)
+                        self.g_sum.add_(self.g_i)
+                        epoch_agg_cost += self.timer_stop(agg_events, t0)
+
+                    p_bar.update()
+
+                # ------- aggregate the window and take an optimizer step --------- #
+                if self.g_sum is not None:
+                    t0 = self.timer_start(agg_events)
+                    agg_g = self.g_sum / self.num_batches
+                    epoch_agg_cost += self.timer_stop(agg_events, t0)
+                elif self.C_J is not None:
+                    # compression runs on device - time it on the GPU timeline as well
+                    t0 = self.timer_start(compression_events)
+                    self.I_k = self.C_J.compress(G=self.G, lr=lr)
+                    epoch_compression_cost += self.timer_stop(compression_events, t0)
+                    self.metrics["jacobian_residual"].append(self.C_J.normalized_residual)
+                    # Gradient aggregation - get aggregated gradient vector
+                    # GARs operate on host arrays - single D2H copy per aggregation
+                    # (I_k is sent as int32 ~ half the bytes; device indexing keeps int64)
+                    agg_g = self.aggregate(G=self.C_J.G_sparse.cpu().float().numpy(),
+                                           ix=self.I_k.to(torch.int32).cpu().numpy())
+                else:
+                    if self.G_host is not None:
+                        self.copy_stream.synchronize()
+                        G = self.G_host.float().numpy()
+                    else:
+                        G = self.G.cpu().float().numpy()
+                    agg_g = self.aggregate(G=G, ix=self.I_k)
+
+                epoch_gm_iter += self.gar.num_iter
+                epoch_agg_cost += self.gar.agg_time
+                # Reset GAR stats
+                self.gar.agg_time = 0
+                self.gar.num_iter = 0
+
+                # Update Model Grads with aggregated g : i.e. compute \tilde(g)
+                # (overwrites hem grads - no need to zero them first)
+                dist_grads_to_model(grads=agg_g, learner=self.model)
+
+                # Now Do an optimizer step with x_t+1 = x_t - \eta \tilde(g)
+                self.optimizer.step()
+                self.metrics["num_opt_steps"] += 1
+
+            if cuda_timing:
+                # single sync per epoch ; elapsed_time is in ms
+                torch.cuda.synchronize()
+                epoch_grad_cost = sum(start.elapsed_time(end) for start, end in grad_events) / 1000
+                epoch_compression_cost = sum(start.elapsed_time(end) for start, end in compression_events) / 1000
+                # host side GAR time (agg_time) plus on-device running sum aggregation
+                epoch_agg_cost += sum(start.elapsed_time(end) for start, end in agg_events) / 1000
+
+            # log epoch costs once per epoch and keep running totals
+            self.metrics["epoch_grad_cost"].append(epoch_grad_cost)
+            self.metrics["epoch_agg_cost"].append(epoch_agg_cost)
+            self.metrics["total_grad_cost"] += epoch_grad_cost
+            self.metrics["total_agg_cost"] += epoch_agg_cost
+            if epoch_gm_iter > 0:
+                self.metrics["epoch_gm_iter"].append(epoch_gm_iter)
+                self.metrics["total_gm_iter"] += epoch_gm_iter
+            if epoch_compression_cost > 0:
+                # print("Epoch Sparse Approx Cost: {}".format(epoch_sparse_cost))
+                self.metrics["epoch_compression_cost"].append(epoch_compression_cost)
+                self.metrics["total_compression_cost"] += epoch_compression_cost
 
             train_loss = self.evaluate_classifier(model=self.model,
                                                   train_loader=self.train_loader,
@@ -129,10 +275,6 @@ class ActiveSamplingRobust(TrainPipeline):
             if self.lrs is not None:
                 self.lrs.step()
             # Update Total Complexities
-            self.metrics["total_grad_cost"] = sum(self.metrics["epoch_grad_cost"])
-            self.metrics["total_agg_cost"] = sum(self.metrics["epoch_agg_cost"])
-            self.metrics["total_gm_iter"] = sum(self.metrics["epoch_gm_iter"])
-            self.metrics["total_compression_cost"] = sum(self.metrics["epoch_compression_cost"])
             self.metrics["total_cost"] = self.metrics["total_grad_cost"] + self.metrics["total_agg_cost"] + \
                                          self.metrics[
                                              "total_compression_cost"]
@@ -172,6 +314,17 @@ def _parse_args():
     return args
 
 
+def _to_py(obj):
+    """ Recursively cast numpy arrays / scalars in results to native python types ~ no per scalar default= hook """
+    if isinstance(obj, dict):
+        return {k: _to_py(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_py(v) for v in obj]
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    return obj
+
+
 def run_main():
     args = _parse_args()
     print(args)
@@ -202,7 +355,7 @@ def run_main():
     if not os.path.exists(directory):
         os.makedirs(directory)
     with open(directory + args.o, 'w+') as f:
-        json.dump(results, f, indent=4, ensure_ascii=False, cls=NumpyEncoder)
+        json.dump(_to_py(results), f, indent=4, ensure_ascii=False)
 
 
 if __name__ == '__main__':
@@ -3,13 +3,27 @@
 
 import numpy as np
 from .base_gar import GAR
+from typing import List
 
 
 class Krum(GAR):
     def __init__(self, aggregation_config):
         GAR.__init__(self, aggregation_config=aggregation_config)
 
-    def aggregate(self, G: np.ndarray) -> np.ndarray:
+    def aggregate(self, G: np.ndarray, ix: List[int] = None, axis=0) -> np.ndarray:
+        # if ix given only aggregate along the indexes ignoring the rest of the ix
+        if ix is not None:
+            if axis == 0:
+                g_agg = np.zeros_like(G[0, :])
+                g_agg[ix] = self.krum(G=G[:, ix])
+                return g_agg
+            elif axis == 1:
+                return self.krum(G=G[ix, :])
+            else:
+                raise ValueError("Wrong Axis")
+        return self.krum(G=G)
+
+    def krum(self, G: np.ndarray) -> np.ndarray:
         dist = self.get_krum_dist(G=G)
         krum_conf = self.aggregation_config.get("krum_config", {})
 
@@ -17,13 +31,13 @@ class Krum(GAR):
         min_score = 1e10
         optimal_client_ix = -1
 
-        for ix in range(G.shape[0]):
-            curr_dist = dist[ix, :]
+        for client_ix in range(G.shape[0]):
+            curr_dist = dist[client_ix, :]
             curr_dist = np.sort(curr_dist)
             curr_score = sum(curr_dist[:m])
             if curr_score < min_score:
                 min_score = curr_score
-                optimal_client_ix = ix
+                optimal_client_ix = client_ix
         krum_grad = G[optimal_client_ix, :]
         return krum_grad
 
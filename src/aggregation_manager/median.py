@@ -58,13 +58,19 @@ class GeometricMedian(GAR):
 
         return gm
 
-    def aggregate(self, G: np.ndarray, ix: List[int] = None) -> np.ndarray:
+    def aggregate(self, G: np.ndarray, ix: List[int] = None, axis=0) -> np.ndarray:
         # if ix given only aggregate along the indexes ignoring the rest of the ix
         if ix is not None:
-            g_agg = np.zeros_like(G[0, :])
-            G = G[:, ix]
-            low_rank_gm = self.get_gm(X=G)
-            g_agg[ix] = low_rank_gm
+            if axis == 0:
+                g_agg = np.zeros_like(G[0, :])
+                G = G[:, ix]
+                low_rank_gm = self.get_gm(X=G)
+                g_agg[ix] = low_rank_gm
+            elif axis == 1:
+                G = G[ix, :]
+                g_agg = self.get_gm(X=G)
+            else:
+                raise ValueError("Wrong Axis")
             return g_agg
         else:
             return self.get_gm(X=G)
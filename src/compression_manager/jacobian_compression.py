@@ -11,6 +11,7 @@ corresponds to g_i i.e. gradient vector computed on batch / client i
 """
 
 import numpy as np
+import torch
 np.random.seed(1)
 
 
@@ -51,8 +52,14 @@ class JacobianCompression:
             return G
         elif self.memory_algo == 'ef':
             if self.residual_error is None:
-                self.residual_error = np.zeros((self.n, self.d), dtype=G[0, :].dtype)
-            return (lr * G) + self.residual_error
+                # memory is identical across rows - keep a single vector and broadcast it over G
+                # (kept in float32 even when G is stored in low precision)
+                self.residual_error = torch.zeros_like(G[0, :], dtype=torch.float32) if torch.is_tensor(G) \
+                    else np.zeros_like(G[0, :])
+            # scale into a fresh buffer then add memory in place ~ one n x d temporary instead of two
+            G = lr * G
+            G += self.residual_error
+            return G
         else:
             raise NotImplementedError
 
@@ -61,9 +68,13 @@ class JacobianCompression:
         if not self.memory_algo:
             return
         elif self.memory_algo == 'ef':
-            delta = G - self.G_sparse
-            memory = np.mean(delta, axis=0)
-            self.residual_error = np.tile(memory, (G.shape[0], 1))
+            # mean(G - G_sparse) without materializing the n x d delta
+            if torch.is_tensor(G):
+                # accumulate in float32 ~ a difference of low precision sums cancels badly
+                self.residual_error = (G.sum(0, dtype=torch.float32) -
+                                       self.G_sparse.sum(0, dtype=torch.float32)) / G.shape[0]
+            else:
+                self.residual_error = (G.sum(0) - self.G_sparse.sum(0)) / G.shape[0]
             self.G_sparse /= lr
         else:
             raise NotImplementedError
@@ -76,8 +87,10 @@ class SparseApproxMatrix(JacobianCompression):
         self.k = None  # Number of ix ~ to be auto populated
 
     def compress(self, G: np.ndarray, lr=1) -> np.ndarray:
-
-        self.G_sparse = np.zeros_like(G)
+        """
+        G can either be a np.ndarray or a torch.Tensor (ex - Jacobian kept on GPU);
+        G_sparse and I_k are returned in the same format
+        """
         if self.compression_rule not in ['active_norm_sampling', 'random_sampling']:
             raise NotImplementedError
 
@@ -99,10 +112,12 @@ class SparseApproxMatrix(JacobianCompression):
         if self.compression_rule == 'active_norm_sampling':
             I_k = self._active_norm_sampling(G=G)
         elif self.compression_rule == 'random_sampling':
-            I_k = self._random_sampling(d=self.d if self.axis == 0 else self.n)
+            I_k = self._random_sampling(d=self.d if self.axis == 0 else self.n,
+                                        device=G.device if torch.is_tensor(G) else None)
         else:
             raise NotImplementedError
 
+        self.G_sparse = torch.zeros_like(G) if torch.is_tensor(G) else np.zeros_like(G)
         if self.axis == 0:
             self.G_sparse[:, I_k] = G[:, I_k]
         elif self.axis == 1:
@@ -115,10 +130,13 @@ class SparseApproxMatrix(JacobianCompression):
         return I_k
 
     # Implementation of different "Matrix Sparse Approximation" strategies
-    def _random_sampling(self, d) -> np.ndarray:
+    def _random_sampling(self, d, device=None) -> np.ndarray:
         """
         Implements Random (Gauss Siedel) subset Selection
         """
+        if device is not None:
+            return torch.randperm(d, device=device)[:self.k]
+
         all_ix = np.arange(d)
         I_k = np.random.choice(a=all_ix,
                                size=self.k,
@@ -132,14 +150,22 @@ class SparseApproxMatrix(JacobianCompression):
         Ref: Drineas, P., Kannan, R., and Mahoney, M. W.  Fast monte carlo algorithms for matrices:
         Approximating matrix multiplication. SIAM Journal on Computing, 36(1):132–157, 2006
         """
-        # Exact Implementation ~ O(d log d)
+        if torch.is_tensor(G):
+            # top-k selection on device ~ no full sort needed
+            # float32 norms ~ low precision G would tie the normalized mass (~1/d) and skew the residual
+            norm_dist = torch.linalg.vector_norm(G, dim=self.axis, dtype=torch.float32)
+            norm_dist /= norm_dist.sum()
+            top_k_mass, I_k = torch.topk(norm_dist, self.k, sorted=False)
+            self.normalized_residual = top_k_mass.sum().item()
+            return I_k
+
+        # Exact Implementation ~ O(d) selection instead of O(d log d) full sort
         # norm_dist = G.sum(axis=self.axis)
         # norm_dist = np.square(norm_dist)
-        norm_dist = np.linalg.norm(G, axis=self.axis)
+        norm_dist = np.sqrt(np.einsum('ij,ij->j' if self.axis == 0 else 'ij,ij->i', G, G))
         norm_dist /= norm_dist.sum()
-        sorted_ix = np.argsort(norm_dist)[::-1]
-
-        I_k = sorted_ix[:self.k]
+        # guard k = 0 (frac < 1/d) ~ a [-0:] slice would select every index
+        I_k = np.argpartition(norm_dist, -self.k)[-self.k:] if self.k > 0 else np.array([], dtype=np.intp)
 
         mass_explained = np.sum(norm_dist[I_k])
         self.normalized_residual = mass_explained
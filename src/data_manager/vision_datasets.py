@@ -34,6 +34,17 @@ class VisionDataManager:
 
         return mean, std
 
+    def _get_loader_conf(self) -> Dict:
+        """ DataLoader worker and host memory settings shared by train and test iterators """
+        num_workers = self.data_config.get('num_workers', 0)
+        loader_conf = {'num_workers': num_workers,
+                       'pin_memory': torch.cuda.is_available()}
+        if num_workers > 0:
+            # keep hem workers alive across epochs instead of re-spawning them every epoch
+            loader_conf['persistent_workers'] = True
+            loader_conf['prefetch_factor'] = self.data_config.get('prefetch_factor', 4)
+        return loader_conf
+
 
 class MNIST(VisionDataManager):
     def __init__(self, data_config):
@@ -55,9 +66,10 @@ class MNIST(VisionDataManager):
         # create iterators
         tr_batch_size = self.data_config.get('train_batch_size', 1)
         test_batch_size = self.data_config.get('test_batch_size', 512)
-        train_loader = DataLoader(dataset=_train_dataset, batch_size=tr_batch_size, shuffle=True)
+        loader_conf = self._get_loader_conf()
+        train_loader = DataLoader(dataset=_train_dataset, batch_size=tr_batch_size, shuffle=True, **loader_conf)
         print('Num of Batches in Train Loader = {}'.format(len(train_loader)))
-        test_loader = DataLoader(dataset=_test_dataset, batch_size=test_batch_size)
+        test_loader = DataLoader(dataset=_test_dataset, batch_size=test_batch_size, **loader_conf)
 
         return train_loader, test_loader
 
@@ -82,9 +94,10 @@ class FashionMNIST(VisionDataManager):
         # create iterators
         tr_batch_size = self.data_config.get('train_batch_size', 1)
         test_batch_size = self.data_config.get('test_batch_size', 512)
-        train_loader = DataLoader(dataset=_train_dataset, batch_size=tr_batch_size, shuffle=True)
+        loader_conf = self._get_loader_conf()
+        train_loader = DataLoader(dataset=_train_dataset, batch_size=tr_batch_size, shuffle=True, **loader_conf)
         print('Num of Batches in Train Loader = {}'.format(len(train_loader)))
-        test_loader = DataLoader(dataset=_test_dataset, batch_size=test_batch_size)
+        test_loader = DataLoader(dataset=_test_dataset, batch_size=test_batch_size, **loader_conf)
 
         return train_loader, test_loader
 
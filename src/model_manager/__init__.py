@@ -60,14 +60,16 @@ def get_optimizer(params, optimizer_config: Dict = None):
                          momentum=optimizer_config.get('momentum', 0),
                          weight_decay=optimizer_config.get('reg', 0),
                          nesterov=optimizer_config.get('nesterov', False),
-                         dampening=optimizer_config.get('damp', 0))
+                         dampening=optimizer_config.get('damp', 0),
+                         foreach=optimizer_config.get('foreach', True))
     elif opt_alg == 'Adam':
         return optim.Adam(params=params,
                           lr=optimizer_config.get('lr0', 1),
                           betas=optimizer_config.get('betas', (0.9, 0.999)),
                           eps=optimizer_config.get('eps', 1e-08),
                           weight_decay=optimizer_config.get('reg', 0.05),
-                          amsgrad=optimizer_config.get('amsgrad', False))
+                          amsgrad=optimizer_config.get('amsgrad', False),
+                          foreach=optimizer_config.get('foreach', True))
 
     else:
         raise NotImplementedError
@@ -124,22 +126,20 @@ def zero_grad(learner):
 
 def flatten_params(learner) -> np.ndarray:
     """ Given a model flatten hem params and return as np array """
-    flat_param = []
-    # for w in learner.parameters():
-    flat_param.extend(torch.reshape(w.data, (-1,)).tolist() for w in learner.parameters())
-    return np.asarray(flat_param)
-    # flat_param = np.concatenate([w.data.cpu().numpy().flatten() for w in learner.parameters()])
-    # return flat_param
+    flat_param = torch._utils._flatten_dense_tensors([w.data for w in learner.parameters()])
+    return flat_param.cpu().numpy()
 
 
-def flatten_grads(learner) -> np.ndarray:
-    """ Given a model flatten hem params and return as np array """
-    # flat_grad = []
-    # for w in learner.parameters():
-    # flat_grad.extend(torch.reshape(w.grad.data, (-1,)).numpy() for w in learner.parameters())
-    # return np.asarray(flat_grad)
-    flat_grad = np.concatenate([w.grad.data.cpu().numpy().flatten() for w in learner.parameters()])
-    return flat_grad
+def flatten_grads(learner, out: torch.Tensor = None) -> torch.Tensor:
+    """ Given a model flatten hem grads and return as a single tensor (stays on the model device)
+    If out is supplied (ex - a row of the Jacobian) the grads are written into it in a single cat kernel """
+    # grads are preallocated once in run_batch_train (and only memset by zero_grad) so none is None here
+    parameters = list(learner.parameters())
+    assert all(w.grad is not None for w in parameters), 'flatten_grads expects preallocated grads'
+    grads = [w.grad.data.reshape(-1) for w in parameters]
+    if out is None:
+        return torch._utils._flatten_dense_tensors(grads)
+    return torch.cat(grads, out=out)
 
 
 def dist_weights_to_model(weights, learner):
@@ -156,11 +156,16 @@ def dist_weights_to_model(weights, learner):
 def dist_grads_to_model(grads, learner):
     """ Given Gradients and a model architecture this method updates the model gradients (Corresponding to each param)
     with the supplied grads """
-    parameters = learner.parameters()
-    # grads.to(learner.device)
-    offset = 0
-    for param in parameters:
-        new_size = functools.reduce(lambda x, y: x * y, param.shape)
-        current_data = grads[offset:offset + new_size]
-        param.grad = torch.from_numpy(current_data.reshape(param.shape)).to(param.device)
-        offset += new_size
+    parameters = list(learner.parameters())
+    if isinstance(grads, np.ndarray):
+        grads = torch.from_numpy(grads)
+    # single copy of the flat vector to the model device, then split into per param views
+    grads = grads.to(device=parameters[0].device, dtype=parameters[0].dtype)
+    grads = torch._utils._unflatten_dense_tensors(grads, [p.data for p in parameters])
+    if all(p.grad is not None for p in parameters):
+        # write into the existing grad buffers (device local copies of the views)
+        for param, grad in zip(parameters, grads):
+            param.grad.copy_(grad)
+    else:
+        for param, grad in zip(parameters, grads):
+            param.grad = grad
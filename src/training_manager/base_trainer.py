@@ -3,6 +3,7 @@ import numpy as np
 import torch
 import time
 import math
+import functools
 # from src.attack_manager import get_feature_attack, get_grad_attack
 from src.model_manager import (get_model,
                                get_loss,
@@ -27,6 +28,7 @@ class TrainPipeline:
 
         self.num_epochs = self.training_config.get('global_epochs', 10)
         self.eval_freq = self.training_config.get('eval_freq', 10)
+        self.cuda_graph = self.training_config.get('cuda_graph', False)
 
         self.learner_config = self.training_config["learner_config"]
         self.optimizer_config = self.training_config.get("optimizer_config", {})
@@ -36,6 +38,10 @@ class TrainPipeline:
 
         self.aggregation_config = self.training_config["aggregation_config"]
         self.jac_compression_config = self.aggregation_config.get("jacobian_compression_config", {})
+        jacobian_dtype = self.aggregation_config.get("jacobian_dtype", "float32")
+        if jacobian_dtype not in ['float32', 'bfloat16', 'float16']:
+            raise ValueError("Unsupported jacobian_dtype: {}".format(jacobian_dtype))
+        self.jacobian_dtype = getattr(torch, jacobian_dtype)
 
         self.grad_attack_config = self.aggregation_config.get("grad_attack_config", {})
         self.feature_attack_config = self.data_config.get("feature_attack_config", {})
@@ -66,7 +72,21 @@ class TrainPipeline:
         self.I_k = None  # indices when sparse approx Jac to run aggregation faster
 
         self.gar = get_gar(aggregation_config=self.aggregation_config)
+        # aggregation axis is fixed for the run ~ bind it once
+        self.aggregate = functools.partial(self.gar.aggregate,
+                                           axis=self.C_J.axis if self.C_J is not None else 0)
         self.G = None
+        self.G_host = None  # Jacobian in pinned host memory (replaces G) when GAR runs on host
+        self.g_stage = None  # device staging buffers for the rows of G_host
+        self.stage_events = None
+        self.copy_stream = None
+        self.g_sum = None  # running sum of g_i - replaces G for the mean GAR
+        self.g_i = None
+
+        # CUDA graphs of forward + backward + flatten (one per g_i destination) and their static inputs
+        self.grad_graphs = None
+        self.static_images = None
+        self.static_labels = None
 
         # # for adversarial - get attack model
         # self.feature_attack_model = get_feature_attack(attack_config=self.feature_attack_config)
@@ -109,8 +129,8 @@ class TrainPipeline:
             batches = 0
 
             for images, labels in data_loader:
-                images = images.to(device)
-                labels = labels.to(device)
+                images = images.to(device, non_blocking=True)
+                labels = labels.to(device, non_blocking=True)
                 outputs = model(images)
 
                 # if criterion is not None: